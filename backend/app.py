@@ -1,98 +1,303 @@
 import os
 import json
-# import psycopg2 # Uncomment if using PostgreSQL
-# from google.cloud import bigquery # Uncomment if using BigQuery
-# from google.cloud import secretmanager # Uncomment if using Secret Manager
-# import stripe # Uncomment if using Stripe
-# import firebase_admin # Uncomment if using Firebase Admin SDK
-# from firebase_admin import credentials, auth as firebase_auth
-
+import logging
+import datetime
+import decimal
+# import functools # Uncomment if using PostgreSQL, BigQuery, Stripe, Firebase Admin SDK or outbound HTTP
+# import queue # Uncomment if using BigQuery or PostgreSQL
+# import threading # Uncomment if using PostgreSQL, BigQuery, Stripe, Firebase Admin SDK or outbound HTTP
+# import time # Uncomment if using BigQuery or PostgreSQL
+# Optional SDKs (SQLAlchemy, BigQuery, Secret Manager, Stripe, Firebase Admin, requests) are
+# imported inside the blocks below that use them. They are slow to import and
+# memory-heavy, so a worker only pays for the features it actually enables.
+
+import orjson # Faster JSON parsing/serialization than the stdlib json module
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
+from flask_caching import Cache
+from werkzeug.http import http_date
 from dotenv import load_dotenv
 from flask_cors import CORS # Import CORS
 
 # Load environment variables from .env file (optional, useful for local dev)
 load_dotenv()
 
+# Per-request details are logged at DEBUG, so they are skipped cheaply at the default
+# INFO level. Set LOG_LEVEL=DEBUG to see them.
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+
+def _orjson_default(o):
+    """ Serialize the types Flask's DefaultJSONProvider supports but orjson does not. """
+    if isinstance(o, datetime.date): # Passed through by OPT_PASSTHROUGH_DATETIME
+        return http_date(o)
+    if isinstance(o, decimal.Decimal): # e.g. NUMERIC columns from PostgreSQL
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class ORJSONProvider(JSONProvider):
+    """ JSON provider backed by orjson, used by request.get_json() and jsonify(). """
+
+    sort_keys = True # Same default as Flask's DefaultJSONProvider
+
+    def _dumps_bytes(self, obj):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_orjson_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Same arguments as jsonify(): one value, several values (a list) or keyword args
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        obj = args[0] if len(args) == 1 else (args or kwargs or None)
+        # Build the body from orjson's bytes directly, skipping the str round trip
+        return self._app.response_class(self._dumps_bytes(obj), mimetype='application/json')
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 # IMPORTANT: Configure CORS correctly for your frontend URL in production.
 # For development, allowing '*' is okay, but restrict it in production.
 # Example: CORS(app, resources={r"/api/*": {"origins": "https://your-frontend-domain.com"}})
 CORS(app) # Allows all origins by default
+# In-process response cache for stable, idempotent routes. SimpleCache is per worker;
+# switch CACHE_TYPE to e.g. 'RedisCache' to share entries across workers/instances.
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
 
 # --- Configuration (Load from Environment Variables or Secret Manager) ---
 # It's STRONGLY recommended to use Secret Manager in GCP for sensitive data.
 # Example using environment variables:
-# POSTGRES_DB = os.environ.get('POSTGRES_DB')
-# POSTGRES_USER = os.environ.get('POSTGRES_USER')
-# POSTGRES_PASSWORD = os.environ.get('POSTGRES_PASSWORD') # Load from Secret Manager!
-# POSTGRES_HOST = os.environ.get('POSTGRES_HOST') # e.g., '/cloudsql/project:region:instance' for Cloud SQL
+# DB_URL = os.environ.get('DB_URL') # e.g., 'postgresql+psycopg2://user:password@/dbname?host=/cloudsql/project:region:instance'
 # BQ_PROJECT_ID = os.environ.get('BQ_PROJECT_ID', 'your-gcp-project-id')
 # BQ_DATASET_ID = os.environ.get('BQ_DATASET_ID', 'your_dataset')
 # BQ_TABLE_ID = os.environ.get('BQ_TABLE_ID', 'your_table')
 # STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY') # Load from Secret Manager!
 # FIREBASE_SERVICE_ACCOUNT_KEY_PATH = os.environ.get('FIREBASE_SERVICE_ACCOUNT_KEY_PATH') # Path to service account JSON
 
-# --- Initialization (Uncomment and configure as needed) ---
-
-# # Initialize Firebase Admin SDK (if backend needs Firebase access)
-# try:
-#     if FIREBASE_SERVICE_ACCOUNT_KEY_PATH:
-#         cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_KEY_PATH)
-#         firebase_admin.initialize_app(cred)
-#         print("Firebase Admin SDK initialized.")
-#     else:
-#         # For environments like Cloud Run/Functions, you might not need a key file
-#         # if the service account has the right permissions.
-#         firebase_admin.initialize_app()
-#         print("Firebase Admin SDK initialized using application default credentials.")
-# except Exception as e:
-#     print(f"Error initializing Firebase Admin SDK: {e}")
-
-
-# # Initialize Stripe (if using Stripe backend)
-# if STRIPE_SECRET_KEY:
-#     stripe.api_key = STRIPE_SECRET_KEY
-#     print("Stripe initialized.")
-# else:
-#     print("Stripe secret key not found. Stripe integration disabled.")
+# Example using Secret Manager. Secrets are fetched once at startup and kept in a
+# module global; calling access_secret_version per request adds a network round trip
+# (plus TLS/auth) to every call.
+# GCP_PROJECT_ID = os.environ.get('GCP_PROJECT_ID', 'your-gcp-project-id')
+# def _load_secrets():
+#     from google.cloud import secretmanager
+#     client = secretmanager.SecretManagerServiceClient()
+#     def access(secret_id):
+#         name = f"projects/{GCP_PROJECT_ID}/secrets/{secret_id}/versions/latest"
+#         return client.access_secret_version(name=name).payload.data.decode('utf-8')
+#     return {
+#         "stripe": access('stripe-secret-key'),
+#         "db_url": access('db-url'),
+#     }
+# SECRETS = _load_secrets()
+# STRIPE_SECRET_KEY = SECRETS["stripe"]
+# DB_URL = SECRETS["db_url"]
+# # If secrets are rotated, refresh SECRETS from a background timer, never inside a request.
 
+# --- Initialization (Uncomment and configure as needed) ---
 
-# # Initialize BigQuery Client (if using BigQuery)
-# try:
-#     bq_client = bigquery.Client(project=BQ_PROJECT_ID)
-#     print(f"BigQuery client initialized for project {BQ_PROJECT_ID}.")
-# except Exception as e:
-#     print(f"Error initializing BigQuery client: {e}")
-#     bq_client = None
+# # Run-once decorator for the lazy getters below (uncomment with any of them).
+# # functools.cache has no lock, so under gthread concurrent first requests would each
+# # run the getter (initializing an SDK twice, or starting two writer threads).
+# def _init_once(fn):
+#     """ Cache a no-argument getter's result; concurrent first calls run it only once. """
+#     lock = threading.Lock()
+#     result = []
+#     @functools.wraps(fn)
+#     def getter():
+#         if not result: # Lock-free once initialized
+#             with lock:
+#                 if not result:
+#                     result.append(fn())
+#         return result[0]
+#     return getter
+
+# # Firebase Admin SDK (if backend needs Firebase access)
+# # Imported and initialized on first use, once per process.
+# @_init_once
+# def _get_firebase_auth():
+#     import firebase_admin
+#     from firebase_admin import credentials, auth
+#     try:
+#         if FIREBASE_SERVICE_ACCOUNT_KEY_PATH:
+#             cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_KEY_PATH)
+#             firebase_admin.initialize_app(cred)
+#             app.logger.info("Firebase Admin SDK initialized.")
+#         else:
+#             # For environments like Cloud Run/Functions, you might not need a key file
+#             # if the service account has the right permissions.
+#             firebase_admin.initialize_app()
+#             app.logger.info("Firebase Admin SDK initialized using application default credentials.")
+#     except Exception as e:
+#         app.logger.error("Error initializing Firebase Admin SDK: %s", e)
+#     return auth
 
 
-# # Function to get PostgreSQL connection (if using Cloud SQL or other Postgres)
-# def get_postgres_conn():
+# # Stripe (if using Stripe backend)
+# # Imported and configured on first use, once per process.
+# @_init_once
+# def _get_stripe():
+#     import stripe
+#     stripe.api_key = STRIPE_SECRET_KEY
+#     app.logger.info("Stripe initialized.")
+#     return stripe
+
+
+# # Shared HTTP session (if handlers make outbound HTTP calls, e.g. webhooks or auth providers)
+# # One pooled session per process keeps TCP/TLS connections alive between calls;
+# # requests.get()/post() would open a new connection every time.
+# # Imported and created on first use. Call as _get_http().post(url, json=..., timeout=10),
+# # and pass stream=True for large responses so they are not read fully into memory.
+# @_init_once
+# def _get_http():
+#     import requests
+#     from requests.adapters import HTTPAdapter
+#     session = requests.Session()
+#     adapter = HTTPAdapter(pool_connections=50, pool_maxsize=50, max_retries=3)
+#     session.mount("https://", adapter)
+#     session.mount("http://", adapter)
+#     return session
+
+
+# # Batch helper for the background writers below (if using BigQuery or PostgreSQL)
+# def _drain_batch(q, max_items, timeout):
+#     """ Block for one item, then collect more until max_items or `timeout` seconds after the first. """
+#     batch = [q.get()]
+#     deadline = time.monotonic() + timeout # A flush interval, not an idle timeout
 #     try:
-#         conn = psycopg2.connect(
-#             dbname=POSTGRES_DB,
-#             user=POSTGRES_USER,
-#             password=POSTGRES_PASSWORD,
-#             host=POSTGRES_HOST
-#             # For Cloud SQL Unix Socket (recommended):
-#             # host=f'/cloudsql/{YOUR_INSTANCE_CONNECTION_NAME}'
-#             # e.g., host='/cloudsql/my-project:us-central1:my-instance'
-#             # Ensure the Cloud SQL Proxy is running or the service account has permissions.
-
-#             # For Cloud SQL TCP:
-#             # host=YOUR_INSTANCE_PUBLIC_IP (or private IP if using VPC)
-#             # sslmode='require' # Recommended for TCP
-#         )
-#         print("PostgreSQL connection successful.")
-#         return conn
+#         while len(batch) < max_items:
+#             batch.append(q.get(timeout=max(0, deadline - time.monotonic())))
+#     except queue.Empty:
+#         pass
+#     return batch
+
+
+# # Background BigQuery writer (if using BigQuery)
+# # Requests only enqueue rows; a daemon thread streams them in batches so the
+# # insert_rows_json round trip is off the request path and shared across many rows.
+# # Rows still queued when the process exits are lost.
+# BQ_BATCH_SIZE = 500 # Max rows per insert_rows_json call
+# BQ_FLUSH_INTERVAL = 0.2 # Max seconds a partial batch waits for more rows before flushing
+# _bq_queue = queue.Queue()
+
+# def _bq_flusher(bq_client):
+#     table_ref = bq_client.dataset(BQ_DATASET_ID).table(BQ_TABLE_ID)
+#     while True:
+#         batch = _drain_batch(_bq_queue, BQ_BATCH_SIZE, BQ_FLUSH_INTERVAL)
+#         try:
+#             errors = bq_client.insert_rows_json(table_ref, batch)
+#             if not errors:
+#                 app.logger.debug("Inserted %d rows into BigQuery.", len(batch))
+#             else:
+#                 app.logger.error("BigQuery insert errors: %s", errors)
+#         except Exception as e:
+#             app.logger.error("BigQuery insert error: %s", e)
+
+
+# # BigQuery client (if using BigQuery)
+# # Imported and initialized on first use, once per process; returns None if unavailable.
+# @_init_once
+# def _get_bq_client():
+#     from google.cloud import bigquery
+#     try:
+#         bq_client = bigquery.Client(project=BQ_PROJECT_ID)
+#         app.logger.info("BigQuery client initialized for project %s.", BQ_PROJECT_ID)
 #     except Exception as e:
-#         print(f"Error connecting to PostgreSQL: {e}")
+#         app.logger.error("Error initializing BigQuery client: %s", e)
 #         return None
+#     threading.Thread(target=_bq_flusher, args=(bq_client,), name="bq-flusher", daemon=True).start()
+#     return bq_client
+
+
+# # Initialize SQLAlchemy (if using Cloud SQL or other Postgres)
+# # The engine keeps a connection pool per process; db.session is scoped to the request,
+# # so every query in a request reuses one checked-out connection.
+# # Keep workers * (pool_size + max_overflow), times the number of instances, below
+# # the server's max_connections.
+# if DB_URL:
+#     from flask_sqlalchemy import SQLAlchemy
+#     from sqlalchemy import text
+#     app.config["SQLALCHEMY_DATABASE_URI"] = DB_URL
+#     # For Cloud SQL Unix Socket (recommended):
+#     # DB_URL='postgresql+psycopg2://USER:PASSWORD@/DBNAME?host=/cloudsql/YOUR_INSTANCE_CONNECTION_NAME'
+#     # Ensure the Cloud SQL Proxy is running or the service account has permissions.
+#     # For Cloud SQL TCP, use the instance IP and append '?sslmode=require' (recommended).
+#     # Each gunicorn worker has its own pool; size it to the worker's thread count
+#     # (see gunicorn.conf.py). Connections per instance = workers * (pool_size + max_overflow),
+#     # e.g. 4 * (8 + 2) = 40 with the defaults.
+#     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+#         "pool_size": int(os.environ.get('GUNICORN_THREADS', 8)), # One per request thread
+#         "max_overflow": 2,      # Spare for the background writer thread
+#         "pool_recycle": 3600,   # Recycle before server/proxy idle timeouts
+#         "pool_pre_ping": True,  # Validate connections before use
+#     }
+#     db = SQLAlchemy(app)
+#     app.logger.info("SQLAlchemy initialized.")
+# else:
+#     app.logger.info("DB_URL not found. PostgreSQL integration disabled.")
+#     db = None
+
+
+# # Background PostgreSQL writer (if using PostgreSQL)
+# # Like the BigQuery writer: requests enqueue (email, feedback, received_at) tuples and
+# # a daemon thread inserts each batch with one multi-row INSERT via execute_values,
+# # i.e. one round trip and one statement parse per batch instead of per row.
+# # Rows still queued when the process exits are lost.
+# PG_BATCH_SIZE = 1000 # Max rows per INSERT
+# PG_FLUSH_INTERVAL = 0.2 # Max seconds a partial batch waits for more rows before flushing
+# _pg_queue = queue.Queue()
+
+# def _pg_flusher():
+#     from psycopg2.extras import execute_values
+#     with app.app_context():
+#         engine = db.engine
+#     while True:
+#         batch = _drain_batch(_pg_queue, PG_BATCH_SIZE, PG_FLUSH_INTERVAL)
+#         # Any error drops this batch but keeps the thread alive: it is started only once
+#         # per process, so if it exited the queue would grow while requests still succeed.
+#         conn = None
+#         try:
+#             conn = engine.raw_connection() # psycopg2 connection from the SQLAlchemy pool
+#             with conn.cursor() as cur:
+#                 execute_values(
+#                     cur,
+#                     "INSERT INTO feedback (email, feedback_text, received_at) VALUES %s",
+#                     batch,
+#                     page_size=PG_BATCH_SIZE
+#                 )
+#             conn.commit()
+#             app.logger.debug("Inserted %d rows into PostgreSQL.", len(batch))
+#         except Exception as e:
+#             app.logger.error("PostgreSQL insert error, dropped %d rows: %s", len(batch), e)
+#             if conn is not None:
+#                 # The connection may be broken, so don't roll back on it; invalidate()
+#                 # discards it (the server rolls back) and the pool opens a fresh one.
+#                 conn.invalidate()
+#         finally:
+#             if conn is not None:
+#                 conn.close() # Returns the connection to the pool (no-op once invalidated)
+
+# # Started on first use rather than at import: with gunicorn's preload_app the module
+# # is imported in the master, and threads do not survive the fork into workers.
+# @_init_once
+# def _start_pg_flusher():
+#     threading.Thread(target=_pg_flusher, name="pg-flusher", daemon=True).start()
 
 # --- Routes ---
+# Read-only routes with stable output can use @cache.cached(timeout=...); views whose
+# output depends on their arguments (e.g. DB lookups) can use @cache.memoize(timeout=60).
 
 @app.route('/')
+@cache.cached(timeout=300)
 def index():
     """ Basic health check route. """
     return jsonify({"status": "ok", "message": "Backend is running!"})
@@ -112,44 +317,24 @@ def receive_data():
     if not email or not feedback:
         return jsonify({"error": "Missing 'email' or 'feedback' in request body"}), 400
 
-    print(f"Received data: Email={email}, Feedback={feedback}")
+    # Lazy %-formatting: nothing is formatted when DEBUG is disabled
+    app.logger.debug("Received data: email=%s", email)
 
     # --- Placeholder Database Interactions ---
 
-    # # Example: Insert into PostgreSQL
-    # conn = get_postgres_conn()
-    # if conn:
-    #     try:
-    #         with conn.cursor() as cur:
-    #             cur.execute(
-    #                 "INSERT INTO feedback (email, feedback_text, received_at) VALUES (%s, %s, NOW())",
-    #                 (email, feedback)
-    #             )
-    #             conn.commit()
-    #             print("Data inserted into PostgreSQL.")
-    #     except Exception as e:
-    #         print(f"PostgreSQL insert error: {e}")
-    #         conn.rollback() # Rollback transaction on error
-    #         # Consider returning an error response to the frontend
-    #     finally:
-    #         conn.close()
-
-    # # Example: Insert into BigQuery
-    # if bq_client:
-    #     try:
-    #         table_ref = bq_client.dataset(BQ_DATASET_ID).table(BQ_TABLE_ID)
-    #         rows_to_insert = [
-    #             {"email": email, "feedback": feedback, "timestamp": datetime.datetime.utcnow()}
-    #         ]
-    #         errors = bq_client.insert_rows_json(table_ref, rows_to_insert)
-    #         if not errors:
-    #             print("Data inserted into BigQuery.")
-    #         else:
-    #             print(f"BigQuery insert errors: {errors}")
-    #             # Consider returning an error response
-    #     except Exception as e:
-    #         print(f"BigQuery insert error: {e}")
-    #         # Consider returning an error response
+    # # Example: Insert into PostgreSQL (queued; written in batches by _pg_flusher)
+    # # The timestamp is taken now, not at flush time.
+    # # For queries the response depends on, use db.session directly, e.g.:
+    # #     db.session.execute(text("SELECT ... WHERE email = :email"), {"email": email})
+    # if db:
+    #     _start_pg_flusher()
+    #     _pg_queue.put((email, feedback, datetime.datetime.now(datetime.timezone.utc)))
+
+    # # Example: Insert into BigQuery (queued; written in batches by _bq_flusher)
+    # if _get_bq_client():
+    #     _bq_queue.put(
+    #         {"email": email, "feedback": feedback, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+    #     )
 
     # --- Response ---
     # Send a success response back to the frontend
@@ -164,8 +349,9 @@ def receive_data():
 # def create_payment():
 #     if not request.is_json:
 #         return jsonify({"error": "Request must be JSON"}), 400
-#     if not stripe.api_key:
+#     if not STRIPE_SECRET_KEY:
 #          return jsonify({"error": "Stripe is not configured on the server."}), 500
+#     stripe = _get_stripe()
 
 #     try:
 #         data = request.get_json()
@@ -184,13 +370,14 @@ def receive_data():
 #             'clientSecret': intent.client_secret
 #         })
 #     except Exception as e:
-#         print(f"Stripe PaymentIntent creation error: {e}")
+#         app.logger.error("Stripe PaymentIntent creation error: %s", e)
 #         return jsonify(error=str(e)), 403
 
 
 # --- Example Firebase Admin Endpoint (Placeholder) ---
 # @app.route('/api/set-admin-claim', methods=['POST'])
 # def set_admin():
+#     firebase_auth = _get_firebase_auth()
 #     # IMPORTANT: Protect this endpoint! Ensure only authorized users can call it.
 #     # You might verify an ID token passed in the request header.
 #     # id_token = request.headers.get('Authorization', '').split('Bearer ')[1]
@@ -212,10 +399,10 @@ def receive_data():
 #     try:
 #         # Set custom user claims
 #         firebase_auth.set_custom_user_claims(target_uid, {'admin': True})
-#         print(f"Admin claim set for user: {target_uid}")
+#         app.logger.info("Admin claim set for user: %s", target_uid)
 #         return jsonify({"message": f"Admin claim set for user {target_uid}"}), 200
 #     except Exception as e:
-#         print(f"Error setting custom claim: {e}")
+#         app.logger.error("Error setting custom claim: %s", e)
 #         return jsonify({"error": f"Failed to set claim: {e}"}), 500
 
 
@@ -224,6 +411,6 @@ if __name__ == '__main__':
     # Gunicorn or Cloud Run will set the PORT environment variable
     port = int(os.environ.get('PORT', 8080))
     # Run Flask's development server (for local testing only)
-    # Use Gunicorn in production (as specified in Dockerfile CMD)
+    # Use Gunicorn in production: gunicorn --config gunicorn.conf.py (as specified in Dockerfile CMD)
     app.run(debug=True, host='0.0.0.0', port=port)
 
@@ -0,0 +1,34 @@
+# Gunicorn configuration (used by the Dockerfile CMD).
+# Each worker is a separate process with its own DB connection pool, so size the
+# pool to the thread count: every thread may hold one connection at a time.
+import os
+
+# Cloud Run sets PORT; default matches the local dev port.
+bind = f":{os.environ.get('PORT', '8080')}"
+wsgi_app = 'app:app'
+
+# A common starting point is 2 * CPU + 1 workers; Cloud Run instances usually
+# have 1-2 vCPUs, so default to 4 and override with WEB_CONCURRENCY.
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = 'gthread'
+
+# Cloud Run enforces its own request timeout.
+timeout = 0
+
+# Import the app once in the master and fork workers from it, so module-level setup
+# (Secret Manager fetches, config, imports) runs once instead of once per worker and
+# its memory is shared copy-on-write. Anything that cannot cross a fork (sockets,
+# DB connections, threads) must be created per worker: the app starts its
+# background writers and SDK clients on first use, and post_fork resets the DB pool.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Uncomment if using PostgreSQL: drop pooled connections inherited from the master
+    # (close=False leaves the master's sockets alone); the worker reconnects on demand.
+    # from app import app, db
+    # if db:
+    #     with app.app_context():
+    #         db.engine.dispose(close=False)
+    pass
@@ -11,6 +11,7 @@ Features:
 * Generates a tree-like view of the directory structure, showing all items not
   excluded by ignore rules.
 * Optionally includes the full content of files within the specified depth.
+  Binary files are skipped and files larger than 1 MiB are truncated.
 * Respects `.gitignore` rules found in the repository root by default (requires
   `pathspec` library for full accuracy, falls back to basic matching).
 * Allows disabling `.gitignore` processing (`--no-gitignore`).
@@ -23,8 +24,8 @@ Features:
 * Optionally copies the output directly to the system clipboard (`-c` or
   `--clipboard`, requires `pyperclip`).
 * Defaults to ignoring `.ipynb`, `*lock.json` (e.g., `package-lock.json`),
-  `.git/`, `__pycache__/`, `node_modules/` (can be overridden by modifying
-  the script's defaults or using --no-gitignore).
+  `.git/`, `__pycache__/`, `node_modules/` (directories at any depth; can be
+  overridden by modifying the script's defaults or using --no-gitignore).
 
 Dependencies:
 * Python 3
@@ -104,10 +105,15 @@ the structure and content. The `--include` flag *only* further filters which fil
 contents are displayed *after* the ignore rules have been applied.
 """
 
+import io
 import os
+import re
 import sys
 import fnmatch
 import argparse
+import functools
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Optional Dependencies ---
 try:
@@ -124,7 +130,16 @@ except ImportError:
 
 # --- Globals ---
 GITIGNORE_ROOT = None
-RAW_GITIGNORE_PATTERNS = [] # Stores raw lines for fallback or debugging
+BINARY_SNIFF_BYTES = 8192 # A NUL byte in this many leading bytes marks a file as binary
+MAX_FILE_BYTES = 1024 * 1024 # Contents beyond this size are truncated
+READ_WORKERS = min(32, (os.cpu_count() or 1) * 4) # Threads reading file contents concurrently (I/O bound)
+# Default-ignored directories, matched by (normcased) basename at any depth. Checked
+# with a set lookup before any pattern work, and never scanned.
+EXCLUDED_DIRNAMES = frozenset({'.git', '__pycache__', 'node_modules'})
+# Default-ignored name endings ('*lock.json', e.g. package-lock.json), checked against
+# the normcased name with str.endswith before any pattern work. main() adds '.ipynb'
+# unless disabled.
+EXCLUDED_NAME_SUFFIXES = ('lock.json',)
 
 # --- Core Logic Functions ---
 
@@ -140,250 +155,257 @@ def find_git_root(start_dir):
             return os.path.abspath(start_dir) # Default to start dir's absolute path
         current = parent
 
+class FallbackGitignoreSpec:
+    """Basic .gitignore matcher (no negation) with PathSpec's match_file(), used without `pathspec`."""
+
+    def __init__(self, patterns):
+        full, name = [], []
+        for pat in patterns:
+            if pat.startswith('!'): # Negation is not supported
+                continue
+            # Test for the trailing '/' before normcase, which turns it into '\' on Windows
+            if pat.endswith('/'):
+                base = pat.rstrip('/')
+                # fnmatch's '*' also matches '/', so 'base/*' covers the whole subtree
+                full += (fnmatch.translate(os.path.normcase(base)),
+                         fnmatch.translate(os.path.normcase(base + '/*')))
+            else:
+                regex = fnmatch.translate(os.path.normcase(pat))
+                full.append(regex)
+                name.append(regex)
+        self._match_full = re.compile('|'.join(full)).match if full else None
+        self._match_name = re.compile('|'.join(name)).match if name else None
+
+    def match_file(self, path):
+        # `path` is relative to GITIGNORE_ROOT, '/'-separated, with a trailing '/' for dirs
+        path = path.rstrip('/')
+        item_norm = os.path.normcase(path.rpartition('/')[2])
+        return bool((self._match_full and self._match_full(os.path.normcase(path)))
+                    or (self._match_name and self._match_name(item_norm)))
+
+def compile_custom_patterns(patterns):
+    """Compile custom ignore globs into one matcher(rel_start_path, item_name, is_dir) -> bool."""
+    if not patterns:
+        return lambda rel_start_path, item_name, is_dir: False
+    # OR the fnmatch regexes together: a couple of regex calls per path, not a loop per pattern
+    def union(pats):
+        return re.compile('|'.join(fnmatch.translate(os.path.normcase(p)) for p in pats)).match
+    any_match = union(patterns)
+    dir_patterns = [p for p in patterns if p.endswith('/')]
+    dir_match = union(dir_patterns) if dir_patterns else None
+
+    def match_custom(rel_start_path, item_name, is_dir):
+        # Match against the relative path from start or just the basename
+        if any_match(os.path.normcase(rel_start_path)) or any_match(os.path.normcase(item_name)):
+            return True
+        # Also check if a dir matches a pattern ending with '/'. Normcase after appending
+        # the slash, so it is converted the same way as the pattern's (e.g. to '\' on Windows)
+        return bool(is_dir and dir_match and dir_match(os.path.normcase(rel_start_path + '/')))
+    return match_custom
+
 def parse_gitignore(gitignore_path):
-    """Load .gitignore, return PathSpec object if available, else raw lines."""
-    global RAW_GITIGNORE_PATTERNS
-    RAW_GITIGNORE_PATTERNS = [] # Reset
+    """Load .gitignore, return PathSpec object if available, else a FallbackGitignoreSpec."""
     if not os.path.isfile(gitignore_path):
         return None
+    try:
+        mtime = os.path.getmtime(gitignore_path)
+    except OSError as e:
+        print(f"Warning: Could not parse .gitignore at {gitignore_path}: {e}", file=sys.stderr)
+        return None
+    return _parse_gitignore_cached(gitignore_path, mtime)
+
+# Keyed by mtime so an edited .gitignore is re-read; specs are never mutated, so they can be shared
+@functools.lru_cache(maxsize=32)
+def _parse_gitignore_cached(gitignore_path, mtime):
     try:
         # Read with utf-8, ignore errors in case of mixed encodings
         with open(gitignore_path, 'r', encoding='utf-8', errors='ignore') as f:
             lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-        RAW_GITIGNORE_PATTERNS = lines.copy()
         if PATHSPEC_AVAILABLE:
             return pathspec.PathSpec.from_lines('gitwildmatch', lines)
         else:
-            return lines # Return raw lines as fallback spec
+            return FallbackGitignoreSpec(lines) # Basic matcher with the same match_file() call
     except Exception as e:
         print(f"Warning: Could not parse .gitignore at {gitignore_path}: {e}", file=sys.stderr)
         return None
 
-def should_ignore(path, start_dir, gitignore_spec, custom_patterns):
-    """Check if a given path should be ignored based on gitignore and custom patterns."""
-    abs_path = os.path.abspath(path)
-    item_name = os.path.basename(path)
-
+def should_ignore(rel_repo_path, rel_start_path, item_name, gitignore_spec, match_custom, *, is_dir):
+    """Check if a path should be ignored based on gitignore and custom patterns."""
+    # Paths are '/'-separated and precomputed by the caller: relative to GITIGNORE_ROOT
+    # (rel_repo_path, None to skip .gitignore) and to start_dir. is_dir comes from the
+    # caller's DirEntry, so no stat() is made here.
     # 1. Check .gitignore patterns (relative to GITIGNORE_ROOT)
-    if gitignore_spec and GITIGNORE_ROOT:
+    if gitignore_spec and rel_repo_path is not None:
         try:
-            # Path relative to .gitignore location, using forward slashes
-            rel_repo_path = os.path.relpath(abs_path, GITIGNORE_ROOT).replace(os.sep, '/')
-            is_dir = os.path.isdir(abs_path)
-
-            if PATHSPEC_AVAILABLE and isinstance(gitignore_spec, pathspec.PathSpec):
-                 # pathspec handles files and directories (including those matching patterns without trailing slash)
-                 if gitignore_spec.match_file(rel_repo_path):
-                     return True
-                 # Explicitly check with trailing slash for directory patterns if pathspec needs it
-                 if is_dir and gitignore_spec.match_file(rel_repo_path + '/'):
-                    return True
-
-            elif isinstance(gitignore_spec, list): # Fallback using raw patterns
-                for pat in gitignore_spec:
-                    is_dir_pattern = pat.endswith('/')
-                    pat_base = pat.rstrip('/')
-
-                    # Match full path or basename using fnmatch
-                    if is_dir_pattern:
-                        # Match dir if path IS the pattern or path STARTS WITH pattern/
-                         if rel_repo_path == pat_base or rel_repo_path.startswith(pat_base + '/'):
-                             return True
-                    elif fnmatch.fnmatch(rel_repo_path, pat) or fnmatch.fnmatch(item_name, pat):
-                         # File pattern matches full path or name
-                         return True
-                    # Check if directory matches a file pattern (e.g., 'build' pattern ignoring 'build/' dir)
-                    if is_dir and (fnmatch.fnmatch(rel_repo_path, pat) or fnmatch.fnmatch(item_name, pat)):
-                        return True
-
-        except ValueError:
-            # Path is not relative to GITIGNORE_ROOT (e.g., different drive)
-            pass
+            # PathSpec or FallbackGitignoreSpec. A trailing slash lets one match cover
+            # both directory-only patterns ('build/') and plain ones ('build')
+            if gitignore_spec.match_file(rel_repo_path + '/' if is_dir else rel_repo_path):
+                return True
+
         except Exception as e:
-            # Catch potential errors during path manipulation or matching
-            print(f"Warning: Error during gitignore check for {path}: {e}", file=sys.stderr)
+            # Catch potential errors during matching
+            print(f"Warning: Error during gitignore check for {rel_repo_path}: {e}", file=sys.stderr)
 
     # 2. Check custom ignore patterns (relative to start_dir)
     try:
-        rel_start_path = os.path.relpath(abs_path, start_dir).replace(os.sep, '/')
-        is_dir = os.path.isdir(abs_path) # Check again in case path was relative before
-        for pat in custom_patterns:
-            # Match against the relative path from start or just the basename
-            if fnmatch.fnmatch(rel_start_path, pat) or fnmatch.fnmatch(item_name, pat):
-                return True
-            # Also check if a dir matches a pattern ending with '/'
-            if is_dir and pat.endswith('/') and fnmatch.fnmatch(rel_start_path + '/', pat):
-                 return True
-            # Check if a dir matches a file pattern (e.g., ignore 'output' dir with 'output' pattern)
-            if is_dir and fnmatch.fnmatch(rel_start_path, pat) or fnmatch.fnmatch(item_name, pat):
-                 return True
-
-    except ValueError:
-         # Path is not relative to start_dir
-         pass
+        if match_custom(rel_start_path, item_name, is_dir):
+            return True
+
     except Exception as e:
-        print(f"Warning: Error during custom ignore check for {path}: {e}", file=sys.stderr)
+        print(f"Warning: Error during custom ignore check for {rel_start_path}: {e}", file=sys.stderr)
 
     return False
 
-# MODIFIED: Takes a list of patterns
-def should_include(name, include_patterns):
-    """Check if a name matches ANY of the include patterns (case-insensitive)."""
+def make_ignore_checker(start_dir, gitignore_spec, match_custom):
+    """Bind should_ignore to one set of rules, returning is_ignored(rel_start_path, is_dir)."""
+    repo_prefix = None
+    if GITIGNORE_ROOT:
+        # GITIGNORE_ROOT is start_dir or one of its ancestors (see find_git_root)
+        repo_prefix = os.path.relpath(start_dir, GITIGNORE_ROOT).replace(os.sep, '/')
+        repo_prefix = '' if repo_prefix == '.' else repo_prefix + '/'
+
+    def is_ignored(rel_start_path, is_dir):
+        item_name = rel_start_path.rpartition('/')[2]
+        rel_repo_path = None if repo_prefix is None else repo_prefix + rel_start_path
+        return should_ignore(rel_repo_path, rel_start_path, item_name, gitignore_spec, match_custom, is_dir=is_dir)
+    return is_ignored
+
+def compile_include_patterns(include_patterns):
+    """Compile include patterns into one case-insensitive name matcher, or None to include all."""
     if not include_patterns:
-        return True # No include patterns means contents are included (if not ignored)
-    # Use lower() for consistent case-insensitivity
-    name_lower = name.lower()
-    for pattern in include_patterns:
-        if fnmatch.fnmatch(name_lower, pattern.lower()):
-            return True # Match found
-    return False # No match found in any pattern
-
-# MODIFIED: Removed include_pattern logic from this function
-def get_directory_structure(path, start_dir, max_depth, gitignore_spec, custom_patterns, depth=0):
-    """Generates the directory structure string, respecting ONLY ignore patterns."""
-    if not os.path.isdir(path):
-        return f"Error: '{path}' is not a valid directory."
-
-    indent = '  ' * depth
-    name = os.path.basename(path) if depth > 0 else path
-    prefix = indent + "└─ " if depth > 0 else ""
-
-    # --- Directory Filtering ---
-    # Root directory (depth 0) is always processed initially.
-    # Deeper directories are processed only if NOT ignored. Include pattern is irrelevant here.
-    # Note: ignore check is done *before* calling recursively, see below.
-
-    # --- List Items ---
-    try:
-        # Use scandir for potentially better performance, listdir is fine too
-        items = sorted([entry.name for entry in os.scandir(path)])
-        # Or stick to listdir if scandir causes issues:
-        # items = sorted(os.listdir(path))
-    except PermissionError:
-        return f"{prefix}{name}/\n{indent}  └─ [Permission Denied]"
-    except FileNotFoundError:
-         return f"{prefix}{name}/ [Vanished during scan]"
-
-    # --- Process Child Items ---
-    child_lines = []
-    # Separate listing for clarity, though could be done in one loop with checks
-    files = [i for i in items if os.path.isfile(os.path.join(path, i))]
-    dirs = [d for d in items if os.path.isdir(os.path.join(path, d))]
-
-    child_entries = []
-
-    # Files: Include in structure if NOT ignored.
-    for file in files:
-        file_path = os.path.join(path, file)
-        if not should_ignore(file_path, start_dir, gitignore_spec, custom_patterns):
-             child_entries.append({'name': file, 'type': 'file'}) # Always add if not ignored
-
-    # Dirs: Recurse if NOT ignored.
-    if max_depth == -1 or depth < max_depth:
-        for d in dirs:
-            dir_path = os.path.join(path, d)
-            if not should_ignore(dir_path, start_dir, gitignore_spec, custom_patterns):
-                # Recursive call NO LONGER needs include_patterns
-                subtree_str = get_directory_structure(
-                    dir_path, start_dir, max_depth, gitignore_spec,
-                    custom_patterns, depth + 1
-                )
-                if subtree_str: # Only add if recursion yielded something (wasn't empty/denied)
-                    child_entries.append({'name': d, 'type': 'dir', 'subtree': subtree_str})
-
-    # --- Format Output ---
-    dir_header = f"{prefix}{name}/"
-    lines = [dir_header]
-
-    num_entries = len(child_entries)
-    if num_entries == 0 and depth > 0 :
-         # If a directory is kept (not ignored) but is empty or all its contents
-         # were ignored, it will just show the directory header line.
-         pass # No need to explicitly handle empty directories unless desired
-
-    for i, entry in enumerate(child_entries):
-        is_last = (i == num_entries - 1)
-        connector = "└─" if is_last else "├─"
-        item_indent = indent + "  "
-
-        if entry['type'] == 'file':
-            lines.append(f"{item_indent}{connector} {entry['name']}")
-        elif entry['type'] == 'dir':
-            # Append the formatted subtree from the recursive call
-            subtree_lines = entry['subtree'].splitlines()
-            if subtree_lines:
-                first_line = subtree_lines[0]
-                # Find the name in the first line "  └─ dirname/" to prepend correctly
-                # Use os.path.basename to handle potential nested structures correctly
-                base_name = os.path.basename(entry['name'])
-                try:
-                    # Find the last occurrence of the basename to handle cases like dir/dir/
-                    name_start_index = first_line.rindex(base_name)
-                    # Ensure we don't accidentally match part of the indent/connector
-                    if name_start_index > len(item_indent) + len(connector):
-                         lines.append(f"{item_indent}{connector} {first_line[name_start_index:]}")
-                         # Adjust indentation for subsequent lines based on the *new* prefix
-                         sub_indent = " " * (len(item_indent) + len(connector) + 1 + name_start_index - len(first_line.lstrip()))
-                         lines.extend([sub_indent + line for line in subtree_lines[1:]])
-                    else: # Fallback if index seems wrong
-                         lines.append(f"{item_indent}{connector} {first_line.lstrip()}") # Add first line, stripping its indent
-                         lines.extend([item_indent + "  " + line for line in subtree_lines[1:]]) # Indent rest relative to current
-                except ValueError: # Fallback if rindex fails
-                     lines.append(f"{item_indent}{connector} [Error reconstructing subtree for {entry['name']}]")
-                     print(f"Debug: Could not find '{base_name}' in '{first_line}'", file=sys.stderr) # Debugging help
-
-    return '\n'.join(lines)
-
-
-# MODIFIED: Takes include_patterns (plural)
-def get_file_contents(path, start_dir, max_depth, gitignore_spec, custom_patterns, include_patterns, depth=0):
-    """Recursively gets contents of files respecting ignore patterns AND include patterns for filtering."""
-    if not os.path.isdir(path) or (max_depth != -1 and depth > max_depth):
-        return ''
-
+        return None # No include patterns means contents are included (if not ignored)
+    # A name matching ANY pattern is included, so OR their fnmatch regexes together
+    return re.compile(
+        '|'.join(fnmatch.translate(p.lower()) for p in include_patterns), re.IGNORECASE
+    ).match
+
+def read_file_contents(file_path):
+    """Read a file as text, skipping binary files and truncating at MAX_FILE_BYTES."""
+    with open(file_path, 'rb') as f:
+        head = f.read(BINARY_SNIFF_BYTES)
+        if b'\x00' in head:
+            return "<<Binary file skipped>>"
+        # One read for the rest: asking for a byte past the limit detects truncation
+        # without a second read call
+        limit = MAX_FILE_BYTES - len(head)
+        rest = f.read(limit + 1)
+    truncated = len(rest) > limit
+    if truncated:
+        rest = rest[:limit]
+    # Whole-buffer decode; no incremental text-mode decoder
+    text = (head + rest).decode('utf-8', errors='replace')
+    if '\r' in text: # Match text-mode universal newlines
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if truncated:
+        text += f"\n<<Truncated at {MAX_FILE_BYTES} bytes>>"
+    return text
+
+def read_file_item(item):
+    """Read one (rel_file_path, file_path) item, returning (rel_file_path, text or error note)."""
+    rel_file_path, file_path = item
     try:
-        # Use scandir for potentially better performance, listdir is fine too
-        items = sorted([entry.name for entry in os.scandir(path)])
-         # Or stick to listdir if scandir causes issues:
-         # items = sorted(os.listdir(path))
-    except (PermissionError, FileNotFoundError):
-        return ''
-
-    out_parts = []
-
-    # Separate file/dir processing for clarity
-    files = [i for i in items if os.path.isfile(os.path.join(path, i))]
-    dirs = [d for d in items if os.path.isdir(os.path.join(path, d))]
-
-    # Files at current level: Check ignore, then include
-    for file in files:
-        file_path = os.path.join(path, file)
-        if not should_ignore(file_path, start_dir, gitignore_spec, custom_patterns):
+        return rel_file_path, read_file_contents(file_path)
+    except Exception as e:
+        return rel_file_path, f"<<Error reading file {rel_file_path}: {e}>>"
+
+def write_part(out, text):
+    """Append a newline-separated part to an output buffer (like a streaming '\\n'.join)."""
+    if out.tell():
+        out.write('\n')
+    out.write(text)
+
+def walk_entries(top, onerror=None, followlinks=False):
+    """Walk a tree top-down like os.walk, yielding (path, dirs, files) as name-sorted DirEntry lists."""
+    stack = [(top, False)]
+    while stack:
+        path, is_link = stack.pop()
+        if is_link:
+            yield path, [], []
+            continue
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=attrgetter('name'))
+        except (PermissionError, FileNotFoundError) as e:
+            if onerror is not None:
+                onerror(path, e)
+            continue
+        # Classify in one pass from the type cached by the directory read; only
+        # symlinks need a stat() to resolve their target
+        dirs, files = [], []
+        for e in entries:
+            if e.is_dir():
+                dirs.append(e)
+            elif e.is_file():
+                files.append(e)
+        yield path, dirs, files
+        # Push in reverse so the first directory is walked next (pre-order)
+        stack.extend((e.path, not followlinks and e.is_symlink()) for e in reversed(dirs))
+
+# MODIFIED: Single pass producing both structure and contents
+def walk_directory(out, start_dir, max_depth, is_ignored, include_match, submit_read=None,
+                   skip_suffixes=EXCLUDED_NAME_SUFFIXES):
+    """Write start_dir's structure to `out`, returning `submit_read` futures for the contents to show."""
+    reads = []
+    # Per-directory (depth, header line, '/'-separated path from start_dir, prefix
+    # for its children's lines), filled in by the parent before descent
+    pending = {start_dir: (0, f"{start_dir}/", '', '')}
+
+    def on_scan_error(path, error):
+        _, header, _, prefix = pending.pop(path)
+        if isinstance(error, PermissionError):
+            write_part(out, header)
+            write_part(out, f"{prefix}└─ [Permission Denied]")
+        else:
+            write_part(out, f"{header} [Vanished during scan]")
+
+    for path, dirs, files in walk_entries(start_dir, onerror=on_scan_error):
+        depth, header, rel_dir, prefix = pending.pop(path)
+        write_part(out, header)
+        # Children's relative paths extend the parent's, avoiding relpath() per entry
+        rel_prefix = rel_dir + '/' if rel_dir else ''
+
+        # Files: Include in structure if NOT ignored.
+        files = [e for e in files
+                 if not os.path.normcase(e.name).endswith(skip_suffixes)
+                 and not is_ignored(rel_prefix + e.name, False)]
+        # Dirs: Descend if NOT ignored and within depth; pruning here skips the whole subtree.
+        if max_depth == -1 or depth < max_depth:
+            dirs[:] = [e for e in dirs
+                       if (name := os.path.normcase(e.name)) not in EXCLUDED_DIRNAMES
+                       and not name.endswith(skip_suffixes)
+                       and not is_ignored(rel_prefix + e.name, True)]
+        else:
+            dirs[:] = []
+
+        # tree(1)-style lines: each level extends its parent's prefix with a rail
+        # ('│  ') below non-last entries, so no line is re-indented afterwards
+        last = len(files) + len(dirs) - 1
+        for i, entry in enumerate(files):
+            connector = "└─" if i == last else "├─"
+            write_part(out, f"{prefix}{connector} {entry.name}")
+        for i, entry in enumerate(dirs, len(files)):
+            is_last = i == last
+            connector = "└─" if is_last else "├─"
+            child_prefix = prefix + ('   ' if is_last else '│  ')
+            # Header is emitted when the walk reaches the directory, after its preceding siblings
+            pending[entry.path] = (depth + 1, f"{prefix}{connector} {entry.name}/", rel_prefix + entry.name, child_prefix)
+
+        if submit_read is None:
+            continue
+        for entry in files:
             # *** Include patterns check happens HERE for contents ***
-            if should_include(file, include_patterns): # Pass the list of patterns
-                abs_file_path = os.path.abspath(file_path)
-                rel_file_path = os.path.relpath(abs_file_path, start_dir) # Use relative path for output clarity
-                out_parts.append(f"\n--- File: {rel_file_path} ---")
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                        out_parts.append(f.read())
-                except Exception as e:
-                    out_parts.append(f"<<Error reading file {rel_file_path}: {e}>>")
-
-    # Recurse into subdirectories if not ignored
-    if max_depth == -1 or depth < max_depth:
-        for d in dirs:
-            dir_path = os.path.join(path, d)
-            if not should_ignore(dir_path, start_dir, gitignore_spec, custom_patterns):
-                 # Recursive call still needs include_patterns to filter files deeper down
-                 contents_subtree = get_file_contents(
-                     dir_path, start_dir, max_depth, gitignore_spec,
-                     custom_patterns, include_patterns, depth + 1 # Pass list
-                 )
-                 if contents_subtree:
-                     out_parts.append(contents_subtree)
-
-    return '\n'.join(out_parts)
+            if include_match is None or include_match(entry.name):
+                rel_file_path = (rel_prefix + entry.name).replace('/', os.sep) # Use relative path for output clarity
+                reads.append(submit_read(read_file_item, (rel_file_path, entry.path)))
+
+    return reads
+
+def write_file_contents(out, reads):
+    """Write the results of read_file_item futures to `out` in order."""
+    for future in reads:
+        rel_file_path, text = future.result()
+        write_part(out, f"\n--- File: {rel_file_path} ---")
+        write_part(out, text)
 
 
 # --- Main Execution ---
@@ -466,19 +488,19 @@ def main():
     else:
         gitignore_message = ".gitignore processing is disabled."
 
-    # Combine custom and default ignore patterns
+    # Default ignores are plain name checks in walk_directory, not patterns:
+    # '*lock.json' and '*.ipynb' via skip_suffixes, '.git/', '__pycache__/' and
+    # 'node_modules/' via EXCLUDED_DIRNAMES
     custom_patterns = args.custom or []
+    skip_suffixes = EXCLUDED_NAME_SUFFIXES
     if args.ignore_ipynb:
-        custom_patterns.append('*.ipynb')
-    # Add other common things to ignore by default
-    custom_patterns.append('*lock.json') # Ignore package-lock.json, etc.
-    custom_patterns.append('.git/')
-    custom_patterns.append('__pycache__/')
-    custom_patterns.append('node_modules/')
+        skip_suffixes += ('.ipynb',)
     # Consider adding others like *.pyc, *.DS_Store if needed
+    # Compile once here into a single matcher; should_ignore runs it for every file and directory
+    match_custom = compile_custom_patterns(custom_patterns)
 
     # --- Generation ---
-    final_output = []
+    final_output = io.StringIO() # Every section is written once, in order
     header_info = [
         f"Target Directory: {start_dir_abs}",
         f"Max Depth: {'Unlimited' if args.depth == -1 else args.depth}",
@@ -512,41 +534,36 @@ def main():
     print("-" * 20, file=sys.stderr) # Separator in stderr
 
     # Add basic info to the main output as well
-    final_output.append(f"Directory: {start_dir_abs}")
+    write_part(final_output, f"Directory: {start_dir_abs}")
     # MODIFIED: Handle list of include patterns in output header
     if args.include:
         include_patterns_str = ', '.join([f"'{p}'" for p in args.include])
-        final_output.append(f"Contents Filter: {include_patterns_str}")
-    final_output.append("=" * 20) # Separator
+        write_part(final_output, f"Contents Filter: {include_patterns_str}")
+    write_part(final_output, "=" * 20) # Separator
 
 
     try:
-        # Generate structure (NO include patterns needed here)
-        structure = get_directory_structure(
-            start_dir_abs, start_dir_abs, args.depth, gitignore_spec,
-            custom_patterns
-        )
-        if structure:
-             final_output.append("Directory Structure:")
-             final_output.append(structure)
-        else:
-             final_output.append("Directory Structure: (No items found or all ignored)")
-
-
-        # Generate contents (include patterns ARE needed here)
-        if args.contents:
-            # Pass the list of include patterns (args.include)
-            contents = get_file_contents(
-                start_dir_abs, start_dir_abs, args.depth, gitignore_spec,
-                custom_patterns, args.include # Pass the list here
+        # Walk once; structure lines go straight into the output buffer
+        # (include patterns only filter contents)
+        write_part(final_output, "Directory Structure:")
+        # Reads are independent and I/O bound: run them on a pool while the walk continues
+        with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+            reads = walk_directory(
+                final_output, start_dir_abs, args.depth,
+                make_ignore_checker(start_dir_abs, gitignore_spec, match_custom),
+                compile_include_patterns(args.include),
+                executor.submit if args.contents else None,
+                skip_suffixes
             )
-            if contents:
-                final_output.append("\n" + ("=" * 20) + "\nFile Contents:")
-                final_output.append(contents)
-            elif structure and args.include: # Structure existed, but no contents matched include
-                 final_output.append("\n" + ("=" * 20) + "\nFile Contents: (No file contents matched the include filter(s))")
-            elif structure: # Structure existed, but no files or all files empty/unreadable
-                 final_output.append("\n" + ("=" * 20) + "\nFile Contents: (No files found or content could not be read)")
+
+            if args.contents:
+                if reads:
+                    write_part(final_output, "\n" + ("=" * 20) + "\nFile Contents:")
+                    write_file_contents(final_output, reads)
+                elif args.include: # Structure existed, but no contents matched include
+                     write_part(final_output, "\n" + ("=" * 20) + "\nFile Contents: (No file contents matched the include filter(s))")
+                else: # Structure existed, but no files or all files empty/unreadable
+                     write_part(final_output, "\n" + ("=" * 20) + "\nFile Contents: (No files found or content could not be read)")
 
 
     except Exception as e:
@@ -554,11 +571,11 @@ def main():
          import traceback
          traceback.print_exc(file=sys.stderr)
          # Optionally add error message to main output too
-         final_output.append("\n" + "="*20 + f"\nERROR during processing: {e}")
+         write_part(final_output, "\n" + "="*20 + f"\nERROR during processing: {e}")
          # sys.exit(1) # Or allow script to finish and print partial output
 
     # --- Output ---
-    full_output_str = '\n'.join(final_output)
+    full_output_str = final_output.getvalue()
     print(full_output_str) # Print main output to stdout
 
     if args.clipboard: # Check again in case it was disabled